@@ -0,0 +1,506 @@
+"""
+Hard-Example Frame Capture for AR Safety Mirror
+This module keeps a per-camera, memory-mapped ring buffer of raw frames and
+their detections so low-confidence frames can be retained for synthetic data
+generation / retraining and replayed through the detector for benchmarking
+"""
+
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# File header: magic, version, slot count, max payload bytes, max detections,
+# total writes
+FILE_HEADER = struct.Struct("<4sIIIIQ")
+FILE_MAGIC = b"ARFB"
+FILE_VERSION = 2
+
+# Slot header: sequence (odd while writing), frame id, timestamp,
+# payload length, number of detections, flags
+SLOT_HEADER = struct.Struct("<QqdIHH")
+
+# Detection record: class id, confidence, bbox [x, y, width, height]
+DETECTION_RECORD = struct.Struct("<Hf4f")
+
+# Camera ids are used as file names inside the capture directory
+CAMERA_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Frame flags
+FLAG_LOW_CONFIDENCE = 0x1
+FLAG_DISAGREEMENT = 0x2
+
+
+class CameraLimitError(ValueError):
+    """Raised when a new camera would exceed the open camera limit"""
+
+
+class FrameRingBuffer:
+    """Fixed-size ring of frame slots backed by a memory-mapped file.
+
+    Each slot is preallocated in the file, so recording a frame is a handful of
+    ``pack_into`` calls plus one copy of the payload into the map. There is a
+    single writer (the live path); readers use the per-slot sequence number to
+    detect and skip slots that were overwritten while they were being read,
+    so the writer never waits on a reader.
+    """
+
+    def __init__(self, path: str, num_slots: int = 120, max_frame_bytes: int = 256 * 1024,
+                 max_detections: int = 32):
+        self.path = path
+        self.num_slots = num_slots
+        self.max_frame_bytes = max_frame_bytes
+        self.max_detections = max_detections
+        self.slot_size = (SLOT_HEADER.size + max_detections * DETECTION_RECORD.size
+                          + max_frame_bytes)
+        self.dropped_frames = 0
+
+        # Detections are packed here first so a bad record can't leave a slot half written
+        self._detection_scratch = bytearray(max_detections * DETECTION_RECORD.size)
+
+        file_size = FILE_HEADER.size + num_slots * self.slot_size
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(fd).st_size != file_size:
+                os.ftruncate(fd, file_size)
+            self._mm = mmap.mmap(fd, file_size)
+        finally:
+            os.close(fd)
+        self._view = memoryview(self._mm)
+
+        magic, version, slots, frame_bytes, det_slots, writes = FILE_HEADER.unpack_from(
+            self._mm, 0)
+        if (magic, version, slots, frame_bytes, det_slots) == (
+                FILE_MAGIC, FILE_VERSION, num_slots, max_frame_bytes, max_detections):
+            # Resume a buffer left by a previous run
+            self.write_count = writes
+        else:
+            self.write_count = 0
+            for slot in range(num_slots):
+                SLOT_HEADER.pack_into(self._mm, self._slot_offset(slot), 0, 0, 0.0, 0, 0, 0)
+            FILE_HEADER.pack_into(self._mm, 0, FILE_MAGIC, FILE_VERSION, num_slots,
+                                  max_frame_bytes, max_detections, 0)
+
+    def _slot_offset(self, slot: int) -> int:
+        return FILE_HEADER.size + slot * self.slot_size
+
+    def write(self, frame_id: int, timestamp: float, payload: bytes,
+              detections: List[Any], class_ids: Dict[str, int], flags: int = 0) -> bool:
+        """Record a frame and its detections into the next slot"""
+        payload_len = len(payload)
+        if payload_len > self.max_frame_bytes:
+            self.dropped_frames += 1
+            return False
+
+        num_det = min(len(detections), self.max_detections)
+        for i in range(num_det):
+            det = detections[i]
+            x, y, w, h = det.bbox
+            DETECTION_RECORD.pack_into(self._detection_scratch, i * DETECTION_RECORD.size,
+                                       class_ids.get(det.class_name, 0xFFFF),
+                                       det.confidence, x, y, w, h)
+
+        seq = self.write_count + 1
+        offset = self._slot_offset(self.write_count % self.num_slots)
+
+        # Mark slot as being written (odd sequence) before touching the body
+        struct.pack_into("<Q", self._mm, offset, 2 * seq - 1)
+
+        det_offset = offset + SLOT_HEADER.size
+        det_bytes = num_det * DETECTION_RECORD.size
+        self._view[det_offset:det_offset + det_bytes] = \
+            memoryview(self._detection_scratch)[:det_bytes]
+
+        payload_offset = det_offset + self.max_detections * DETECTION_RECORD.size
+        self._view[payload_offset:payload_offset + payload_len] = payload
+
+        SLOT_HEADER.pack_into(self._mm, offset, 2 * seq, frame_id, timestamp,
+                              payload_len, num_det, flags)
+        self.write_count = seq
+        struct.pack_into("<Q", self._mm, FILE_HEADER.size - 8, seq)
+        return True
+
+    def copy_slot_from(self, other: "FrameRingBuffer", index: int) -> bool:
+        """Copy a recorded frame from another buffer with the same slot layout"""
+        if (other.max_frame_bytes != self.max_frame_bytes
+                or other.max_detections != self.max_detections):
+            return False
+        header = other.read_header(index)
+        if header is None:
+            return False
+
+        seq = self.write_count + 1
+        offset = self._slot_offset(self.write_count % self.num_slots)
+        src_offset = other._slot_offset(index % other.num_slots)
+        struct.pack_into("<Q", self._mm, offset, 2 * seq - 1)
+
+        # Copy the used part of the slot (after the sequence number) between the maps
+        used = SLOT_HEADER.size + self.max_detections * DETECTION_RECORD.size + header[3]
+        self._view[offset + 8:offset + used] = other._view[src_offset + 8:src_offset + used]
+
+        struct.pack_into("<Q", self._mm, offset, 2 * seq)
+        self.write_count = seq
+        struct.pack_into("<Q", self._mm, FILE_HEADER.size - 8, seq)
+        return True
+
+    def read_header(self, index: int) -> Optional[tuple]:
+        """Read the slot header for a write index, or None if it was overwritten"""
+        if index < 0 or index >= self.write_count or index < self.write_count - self.num_slots:
+            return None
+
+        header = SLOT_HEADER.unpack_from(self._mm, self._slot_offset(index % self.num_slots))
+        if header[0] != 2 * (index + 1):
+            return None
+        return header
+
+    def read(self, index: int) -> Optional[Dict[str, Any]]:
+        """Read the frame with the given write index, or None if it was overwritten"""
+        header = self.read_header(index)
+        if header is None:
+            return None
+
+        offset = self._slot_offset(index % self.num_slots)
+        expected_seq, frame_id, timestamp, payload_len, num_det, flags = header
+
+        det_offset = offset + SLOT_HEADER.size
+        detections = []
+        for i in range(num_det):
+            class_id, confidence, x, y, w, h = DETECTION_RECORD.unpack_from(
+                self._mm, det_offset + i * DETECTION_RECORD.size)
+            detections.append({
+                "class_id": class_id,
+                "confidence": confidence,
+                "bbox": [x, y, w, h]
+            })
+
+        payload_offset = det_offset + self.max_detections * DETECTION_RECORD.size
+        payload = bytes(self._view[payload_offset:payload_offset + payload_len])
+
+        # The writer may have lapped us while copying
+        if struct.unpack_from("<Q", self._mm, offset)[0] != expected_seq:
+            return None
+
+        return {
+            "index": index,
+            "frame_id": frame_id,
+            "timestamp": timestamp,
+            "flags": flags,
+            "detections": detections,
+            "payload": payload
+        }
+
+    def window(self, last_n: Optional[int] = None) -> range:
+        """Write indices of the frames still held in the buffer, oldest first"""
+        start = max(0, self.write_count - self.num_slots)
+        if last_n is not None:
+            start = max(start, self.write_count - last_n)
+        return range(start, self.write_count)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get buffer occupancy statistics"""
+        return {
+            "path": self.path,
+            "num_slots": self.num_slots,
+            "frames_written": self.write_count,
+            "frames_held": len(self.window()),
+            "dropped_frames": self.dropped_frames
+        }
+
+    @staticmethod
+    def read_file_stats(path: str) -> Optional[Dict[str, Any]]:
+        """Get occupancy statistics from a ring file's header without mapping it"""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(FILE_HEADER.size)
+        except OSError:
+            return None
+        if len(header) < FILE_HEADER.size:
+            return None
+
+        magic, version, slots, _, _, writes = FILE_HEADER.unpack(header)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            return None
+        return {
+            "path": path,
+            "num_slots": slots,
+            "frames_written": writes,
+            "frames_held": min(writes, slots)
+        }
+
+    def close(self):
+        """Flush and unmap the buffer"""
+        self._view.release()
+        self._mm.flush()
+        self._mm.close()
+
+
+class HardExamplePolicy:
+    """Decides which frames are worth keeping as hard examples.
+
+    A detection counts as low confidence when it only just cleared the
+    detector's own confidence threshold, i.e. it is within ``margin`` of it.
+    The default threshold matches ``SafetyObjectDetector``. With the mock
+    detector (confidences from about 0.80 up) the default margin flags roughly
+    one frame in ten.
+
+    Flagged frames are retained at no more than ``max_retention_rate`` of the
+    camera's frames (with bursts of up to ``retention_burst`` frames), so the
+    retained ring stays a selection of rare frames even when a model is
+    uncertain most of the time.
+    """
+
+    def __init__(self, detection_threshold: float = 0.6, margin: float = 0.21,
+                 max_retention_rate: float = 0.05, retention_burst: float = 4.0):
+        self.detection_threshold = detection_threshold
+        self.margin = margin
+        self.low_confidence_threshold = detection_threshold + margin
+        self.max_retention_rate = max_retention_rate
+        self.retention_burst = retention_burst
+
+    def evaluate(self, detections: List[Any], class_mask: int,
+                 previous_mask: Optional[int]) -> int:
+        """Return retention flags for a frame"""
+        flags = 0
+        for det in detections:
+            if det.confidence < self.low_confidence_threshold:
+                flags |= FLAG_LOW_CONFIDENCE
+                break
+
+        # Disagreement: the set of detected classes changed from the previous frame
+        if previous_mask is not None and class_mask != previous_mask:
+            flags |= FLAG_DISAGREEMENT
+
+        return flags
+
+
+class FrameCaptureManager:
+    """Per-camera live and retained ring buffers plus the replay API"""
+
+    def __init__(self, class_names: List[str], capture_dir: str = "captures",
+                 policy: Optional[HardExamplePolicy] = None, live_slots: int = 120,
+                 retained_slots: int = 64, max_frame_bytes: int = 256 * 1024,
+                 max_cameras: int = 8):
+        self.class_names = class_names
+        self.class_ids = {name: i for i, name in enumerate(class_names)}
+        self.capture_dir = capture_dir
+        self.policy = policy or HardExamplePolicy()
+        self.live_slots = live_slots
+        self.retained_slots = retained_slots
+        self.max_frame_bytes = max_frame_bytes
+        self.max_cameras = max_cameras
+        self.cameras: Dict[str, Dict[str, Any]] = {}
+        self.frames_skipped = 0
+        self.capture_errors = 0
+        self._cameras_lock = threading.Lock()
+
+    def _captured_on_disk(self) -> set:
+        """Camera ids that have ring files in the capture directory"""
+        if not os.path.isdir(self.capture_dir):
+            return set()
+        suffix = ".live.ring"
+        return {
+            name[:-len(suffix)] for name in os.listdir(self.capture_dir)
+            if name.endswith(suffix) and CAMERA_ID_PATTERN.fullmatch(name[:-len(suffix)])
+        }
+
+    def validate_camera_id(self, camera_id: str) -> None:
+        """Make sure a camera id is safe to use as a ring file name"""
+        if not isinstance(camera_id, str) or not CAMERA_ID_PATTERN.fullmatch(camera_id):
+            raise ValueError(f"Invalid camera id: {camera_id!r}")
+
+    def _get_camera(self, camera_id: str) -> Dict[str, Any]:
+        camera = self.cameras.get(camera_id)
+        if camera is not None:
+            return camera
+
+        with self._cameras_lock:
+            camera = self.cameras.get(camera_id)
+            if camera is not None:
+                return camera
+
+            self.validate_camera_id(camera_id)
+            if len(self.cameras) >= self.max_cameras:
+                raise CameraLimitError(f"Camera limit reached ({self.max_cameras})")
+            camera = {
+                "live": FrameRingBuffer(os.path.join(self.capture_dir, f"{camera_id}.live.ring"),
+                                        self.live_slots, self.max_frame_bytes),
+                "retained": FrameRingBuffer(
+                    os.path.join(self.capture_dir, f"{camera_id}.retained.ring"),
+                    self.retained_slots, self.max_frame_bytes),
+                "previous_mask": None,
+                "retention_credit": self.policy.retention_burst,
+                "frames_flagged": 0,
+                "frames_rate_limited": 0
+            }
+            self.cameras[camera_id] = camera
+            return camera
+
+    def record_frame(self, camera_id: str, frame_id: int, payload: bytes,
+                     detections: List[Any]) -> int:
+        """Record a live frame and retain it if the policy flags it.
+
+        Returns the frame's flags if it was retained, otherwise 0.
+
+        Only an invalid camera id raises; hitting the camera limit or any other
+        capture error skips the frame so the live path keeps serving detections.
+        """
+        self.validate_camera_id(camera_id)
+        try:
+            return self._record_frame(camera_id, frame_id, payload, detections)
+        except CameraLimitError:
+            self.frames_skipped += 1
+        except Exception as e:
+            self.capture_errors += 1
+            print(f"Frame capture failed: {e}")
+        return 0
+
+    def _record_frame(self, camera_id: str, frame_id: int, payload: bytes,
+                      detections: List[Any]) -> int:
+        camera = self._get_camera(camera_id)
+
+        class_mask = 0
+        for det in detections:
+            class_mask |= 1 << self.class_ids.get(det.class_name, 63)
+
+        flags = self.policy.evaluate(detections, class_mask, camera["previous_mask"])
+
+        live = camera["live"]
+        if not live.write(frame_id, time.time(), payload, detections, self.class_ids, flags):
+            return 0
+        camera["previous_mask"] = class_mask
+
+        # Every live frame earns a fraction of a retention; each retained frame spends one
+        credit = min(self.policy.retention_burst,
+                     camera["retention_credit"] + self.policy.max_retention_rate)
+        if not flags:
+            camera["retention_credit"] = credit
+            return 0
+
+        camera["frames_flagged"] += 1
+        if credit < 1.0:
+            camera["retention_credit"] = credit
+            camera["frames_rate_limited"] += 1
+            return 0
+
+        camera["retention_credit"] = credit - 1.0
+        camera["retained"].copy_slot_from(live, live.write_count - 1)
+        return flags
+
+    def replay(self, camera_id: str, detect_fn: Callable[[bytes], List[Any]],
+               source: str = "retained", last_n: Optional[int] = None) -> Dict[str, Any]:
+        """Feed a captured window back through the detector as fast as possible"""
+        if source not in ("live", "retained"):
+            raise ValueError(f"Unsupported replay source: {source}")
+        if last_n is not None and (isinstance(last_n, bool) or not isinstance(last_n, int)
+                                   or last_n <= 0):
+            raise ValueError(f"last_n must be a positive integer: {last_n!r}")
+        self.validate_camera_id(camera_id)
+        if camera_id not in self.cameras and camera_id not in self._captured_on_disk():
+            raise ValueError(f"No captured frames for camera: {camera_id}")
+
+        # Opens ring files left by a previous run if this camera hasn't recorded yet
+        buffer = self._get_camera(camera_id)[source]
+        frames_replayed = 0
+        frames_skipped = 0
+        class_matches = 0
+        recorded_confidence = 0.0
+        replayed_confidence = 0.0
+        recorded_count = 0
+        replayed_count = 0
+
+        start_time = time.perf_counter()
+        for index in buffer.window(last_n):
+            frame = buffer.read(index)
+            if frame is None:
+                frames_skipped += 1
+                continue
+
+            detections = detect_fn(frame["payload"])
+            frames_replayed += 1
+
+            recorded_classes = {det["class_id"] for det in frame["detections"]}
+            replayed_classes = {self.class_ids.get(det.class_name, 0xFFFF) for det in detections}
+            if recorded_classes == replayed_classes:
+                class_matches += 1
+
+            recorded_confidence += sum(det["confidence"] for det in frame["detections"])
+            recorded_count += len(frame["detections"])
+            replayed_confidence += sum(det.confidence for det in detections)
+            replayed_count += len(detections)
+
+        elapsed = time.perf_counter() - start_time
+
+        return {
+            "status": "success",
+            "camera_id": camera_id,
+            "source": source,
+            "frames_replayed": frames_replayed,
+            "frames_skipped": frames_skipped,
+            "elapsed": f"{elapsed:.3f}s",
+            "fps": round(frames_replayed / elapsed, 1) if elapsed > 0 else 0.0,
+            "class_agreement": round(class_matches / frames_replayed, 3) if frames_replayed else 0.0,
+            "avg_confidence_recorded": round(recorded_confidence / recorded_count, 3)
+            if recorded_count else 0.0,
+            "avg_confidence_replayed": round(replayed_confidence / replayed_count, 3)
+            if replayed_count else 0.0
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get capture statistics for every open camera and every camera on disk"""
+        cameras = {
+            camera_id: {
+                "open": True,
+                "live": camera["live"].get_stats(),
+                "retained": camera["retained"].get_stats(),
+                "frames_flagged": camera["frames_flagged"],
+                "frames_rate_limited": camera["frames_rate_limited"]
+            }
+            for camera_id, camera in list(self.cameras.items())
+        }
+
+        # Captures left by earlier runs are read from the file headers, not mapped
+        for camera_id in self._captured_on_disk() - set(cameras):
+            cameras[camera_id] = {
+                "open": False,
+                **{
+                    source: FrameRingBuffer.read_file_stats(
+                        os.path.join(self.capture_dir, f"{camera_id}.{source}.ring"))
+                    for source in ("live", "retained")
+                }
+            }
+
+        return {
+            "cameras": cameras,
+            "max_cameras": self.max_cameras,
+            "frames_skipped": self.frames_skipped,
+            "capture_errors": self.capture_errors
+        }
+
+    def remove_camera(self, camera_id: str) -> bool:
+        """Close a camera's buffers and delete its ring files"""
+        self.validate_camera_id(camera_id)
+        with self._cameras_lock:
+            camera = self.cameras.pop(camera_id, None)
+            if camera is not None:
+                camera["live"].close()
+                camera["retained"].close()
+
+        removed = camera is not None
+        for source in ("live", "retained"):
+            path = os.path.join(self.capture_dir, f"{camera_id}.{source}.ring")
+            if os.path.exists(path):
+                os.remove(path)
+                removed = True
+        return removed
+
+    def close(self):
+        """Close all camera buffers"""
+        with self._cameras_lock:
+            for camera in self.cameras.values():
+                camera["live"].close()
+                camera["retained"].close()
+            self.cameras.clear()
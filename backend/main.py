@@ -1,9 +1,10 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 import asyncio
 import json
+import os
 import time
 import random
 from datetime import datetime
@@ -13,6 +14,9 @@ from PIL import Image
 import io
 import base64
 
+from frame_capture import FrameCaptureManager, HardExamplePolicy
+from mock_detection import SAFETY_OBJECTS, mock_yolo_detection
+
 app = FastAPI(title="AR Safety Mirror API", version="1.0.0")
 
 # CORS middleware
@@ -24,16 +28,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mock YOLOv8 detection classes
-SAFETY_OBJECTS = [
-    "Fire Extinguisher",
-    "Oxygen Tank", 
-    "Nitrogen Tank",
-    "Fire Alarm",
-    "First Aid Box",
-    "Safety Switch Panel",
-    "Emergency Phone"
-]
+# Confidence threshold of SafetyObjectDetector; the hard-example policy is relative to it
+DETECTION_CONFIDENCE_THRESHOLD = 0.6
 
 # Global state
 connected_clients: List[WebSocket] = []
@@ -46,40 +42,12 @@ model_metrics = {
     "alerts_today": 3
 }
 
-class DetectionResult:
-    def __init__(self, class_name: str, confidence: float, bbox: List[int]):
-        self.class_name = class_name
-        self.confidence = confidence
-        self.bbox = bbox  # [x, y, width, height]
-        self.timestamp = datetime.now()
-
-def mock_yolo_detection(image_data: bytes = None) -> List[DetectionResult]:
-    """Mock YOLOv8 detection function with stable results"""
-    detections = []
-    
-    # Predefined stable detections for consistent demo
-    stable_objects = [
-        {"class": "Fire Extinguisher", "confidence": 0.94, "bbox": [120, 80, 80, 120]},
-        {"class": "Oxygen Tank", "confidence": 0.87, "bbox": [300, 150, 60, 100]},
-        {"class": "First Aid Box", "confidence": 0.92, "bbox": [450, 200, 70, 50]},
-        {"class": "Safety Switch Panel", "confidence": 0.89, "bbox": [200, 300, 40, 60]},
-        {"class": "Emergency Phone", "confidence": 0.85, "bbox": [380, 120, 45, 65]},
-        {"class": "Fire Alarm", "confidence": 0.91, "bbox": [500, 80, 35, 40]}
-    ]
-    
-    # Add slight variations for realism
-    for obj in stable_objects:
-        confidence = obj["confidence"] + random.uniform(-0.05, 0.05)
-        confidence = max(0.75, min(0.98, confidence))
-        
-        bbox = obj["bbox"].copy()
-        # Add minimal jitter for realism
-        bbox[0] += random.randint(-3, 3)
-        bbox[1] += random.randint(-3, 3)
-        
-        detections.append(DetectionResult(obj["class"], confidence, bbox))
-    
-    return detections
+# Per-camera ring buffers of recent frames and retained hard examples
+frame_capture = FrameCaptureManager(
+    SAFETY_OBJECTS,
+    capture_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), "captures"),
+    policy=HardExamplePolicy(DETECTION_CONFIDENCE_THRESHOLD)
+)
 
 def generate_synthetic_data(object_class: str, num_samples: int = 100) -> Dict[str, Any]:
     """Mock Falcon synthetic data generation"""
@@ -120,6 +88,11 @@ def retrain_model(synthetic_data: Dict[str, Any]) -> Dict[str, Any]:
         "samples_used": synthetic_data.get("samples_generated", 0)
     }
 
+@app.on_event("shutdown")
+async def close_frame_capture():
+    """Flush and unmap the frame capture ring files"""
+    frame_capture.close()
+
 @app.get("/")
 async def root():
     return {"message": "AR Safety Mirror API", "status": "active"}
@@ -352,15 +325,24 @@ async def stop_detection():
     return {"status": "success", "message": "Detection stopped"}
 
 @app.post("/api/detection/frame")
-async def process_frame(file: UploadFile = File(...)):
+async def process_frame(file: UploadFile = File(...), camera_id: str = Form("default")):
     """Process single frame from webcam for real-time detection"""
+    try:
+        frame_capture.validate_camera_id(camera_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Read frame data
         frame_data = await file.read()
+        frame_id = int(time.time() * 1000)
         
         # Fast processing for real-time
         detections = mock_yolo_detection(frame_data)
         
+        # Record frame for hard-example capture; capture problems never fail the live path
+        capture_flags = frame_capture.record_frame(camera_id, frame_id, frame_data, detections)
+        
         # Format response for real-time use
         results = []
         for det in detections:
@@ -375,13 +357,55 @@ async def process_frame(file: UploadFile = File(...)):
         return {
             "status": "success",
             "detections": results,
-            "frame_id": int(time.time() * 1000),
+            "frame_id": frame_id,
+            "hard_example": capture_flags != 0,
             "processing_time": f"{random.uniform(0.02, 0.05):.3f}s"
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Frame processing failed: {str(e)}")
 
+@app.get("/api/capture/stats")
+async def get_capture_stats():
+    """Get frame capture buffer statistics per camera"""
+    return {
+        "status": "success",
+        **frame_capture.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.delete("/api/capture/{camera_id}")
+async def remove_captured_camera(camera_id: str):
+    """Delete a camera's ring files to free disk space and a camera slot"""
+    try:
+        removed = frame_capture.remove_camera(camera_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"No captured frames for camera: {camera_id}")
+    
+    return {"status": "success", "message": f"Removed captures for camera {camera_id}"}
+
+@app.post("/api/capture/replay")
+async def replay_captured_frames(request: Dict[str, Any]):
+    """Replay a captured window of frames through the detector"""
+    camera_id = request.get("camera_id", "default")
+    source = request.get("source", "retained")
+    last_n = request.get("last_n")
+    
+    try:
+        # Run off the event loop so replay never stalls live frame processing
+        result = await asyncio.to_thread(
+            frame_capture.replay, camera_id, mock_yolo_detection, source, last_n
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Replay failed: {str(e)}")
+    
+    return result
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -0,0 +1,200 @@
+"""
+Tests for the memory-mapped frame capture ring buffers
+"""
+
+import struct
+
+import pytest
+
+from frame_capture import (
+    FLAG_DISAGREEMENT,
+    FLAG_LOW_CONFIDENCE,
+    FrameCaptureManager,
+    FrameRingBuffer,
+    HardExamplePolicy,
+)
+from mock_detection import SAFETY_OBJECTS, mock_yolo_detection
+
+CLASS_NAMES = ["Fire Extinguisher", "Oxygen Tank"]
+CLASS_IDS = {name: i for i, name in enumerate(CLASS_NAMES)}
+
+
+class Detection:
+    def __init__(self, class_name: str, confidence: float, bbox):
+        self.class_name = class_name
+        self.confidence = confidence
+        self.bbox = bbox
+
+
+def make_buffer(tmp_path, num_slots: int = 4, max_detections: int = 4) -> FrameRingBuffer:
+    return FrameRingBuffer(str(tmp_path / "cam.live.ring"), num_slots, 64, max_detections)
+
+
+def test_wrap_around_keeps_latest_frames(tmp_path):
+    buffer = make_buffer(tmp_path)
+    for i in range(10):
+        buffer.write(i, float(i), bytes([i]) * (i + 1), [], CLASS_IDS)
+
+    assert list(buffer.window()) == [6, 7, 8, 9]
+    assert buffer.read(5) is None
+    frame = buffer.read(9)
+    assert frame["frame_id"] == 9
+    assert frame["payload"] == bytes([9]) * 10
+    assert list(buffer.window(last_n=2)) == [8, 9]
+
+
+def test_read_skips_slot_being_overwritten(tmp_path):
+    buffer = make_buffer(tmp_path)
+    buffer.write(1, 0.0, b"a", [], CLASS_IDS)
+
+    # Simulate the writer lapping the reader: slot 0 now holds an odd sequence
+    struct.pack_into("<Q", buffer._mm, buffer._slot_offset(0), 2 * 5 - 1)
+    assert buffer.read(0) is None
+
+
+def test_float_bbox_is_stored(tmp_path):
+    buffer = make_buffer(tmp_path)
+    buffer.write(1, 0.0, b"a", [Detection("Oxygen Tank", 0.9, [1.5, 2, 3, 4])], CLASS_IDS)
+
+    detection = buffer.read(0)["detections"][0]
+    assert detection["class_id"] == 1
+    assert detection["bbox"] == [1.5, 2.0, 3.0, 4.0]
+
+
+def test_failed_write_leaves_previous_frame_intact(tmp_path):
+    buffer = make_buffer(tmp_path, num_slots=1)
+    buffer.write(1, 0.0, b"a", [], CLASS_IDS)
+
+    with pytest.raises(struct.error):
+        buffer.write(2, 0.0, b"b", [Detection("Oxygen Tank", 0.9, ["x", 2, 3, 4])], CLASS_IDS)
+
+    assert buffer.write_count == 1
+    assert buffer.read(0)["payload"] == b"a"
+
+
+def test_resume_from_file(tmp_path):
+    buffer = make_buffer(tmp_path)
+    for i in range(6):
+        buffer.write(i, float(i), b"frame", [], CLASS_IDS)
+    buffer.close()
+
+    resumed = make_buffer(tmp_path)
+    assert resumed.write_count == 6
+    assert resumed.read(5)["frame_id"] == 5
+    resumed.close()
+
+    # A different slot layout must not be resumed
+    changed = make_buffer(tmp_path, max_detections=8)
+    assert changed.write_count == 0
+    changed.close()
+
+
+def test_flagged_frames_are_retained(tmp_path):
+    manager = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path), live_slots=4,
+                                  retained_slots=2, max_frame_bytes=64,
+                                  policy=HardExamplePolicy(0.6, 0.1))
+    assert manager.record_frame("cam", 1, b"ok", [Detection("Oxygen Tank", 0.9, [0, 0, 1, 1])]) == 0
+    flags = manager.record_frame("cam", 2, b"low", [Detection("Oxygen Tank", 0.65, [0, 0, 1, 1])])
+    assert flags & FLAG_LOW_CONFIDENCE
+
+    retained = manager.cameras["cam"]["retained"]
+    assert retained.write_count == 1
+    assert retained.read(0)["payload"] == b"low"
+    manager.close()
+
+
+def test_class_change_flags_disagreement(tmp_path):
+    manager = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path), live_slots=4,
+                                  retained_slots=2, max_frame_bytes=64,
+                                  policy=HardExamplePolicy(0.6, 0.1))
+    assert manager.record_frame("cam", 1, b"one", [Detection("Oxygen Tank", 0.9, [0, 0, 1, 1])]) == 0
+    flags = manager.record_frame("cam", 2, b"two",
+                                 [Detection("Fire Extinguisher", 0.9, [0, 0, 1, 1])])
+    assert flags == FLAG_DISAGREEMENT
+
+    retained = manager.cameras["cam"]["retained"]
+    assert retained.write_count == 1
+    assert retained.read(0)["payload"] == b"two"
+    manager.close()
+
+
+def test_capture_error_does_not_raise(tmp_path):
+    manager = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path), live_slots=4,
+                                  retained_slots=2, max_frame_bytes=64)
+    detections = [Detection("Oxygen Tank", 0.9, ["x", 2, 3, 4])]
+
+    # The live path keeps its detections: capture just reports nothing retained
+    assert manager.record_frame("cam", 1, b"frame", detections) == 0
+    assert manager.get_stats()["capture_errors"] == 1
+    assert manager.cameras["cam"]["live"].write_count == 0
+    manager.close()
+
+
+def test_retention_rate_with_mock_detector(tmp_path):
+    manager = FrameCaptureManager(SAFETY_OBJECTS, capture_dir=str(tmp_path), live_slots=8,
+                                  retained_slots=8, max_frame_bytes=64,
+                                  policy=HardExamplePolicy(0.6))
+    num_frames = 2000
+    retained = sum(
+        1 for i in range(num_frames)
+        if manager.record_frame("cam", i, b"frame", mock_yolo_detection())
+    )
+
+    stats = manager.get_stats()["cameras"]["cam"]
+    assert 0 < stats["frames_flagged"] / num_frames < 0.2
+    assert 0 < retained / num_frames <= 0.06
+    assert stats["retained"]["frames_written"] == retained
+    manager.close()
+
+
+def test_replay_after_restart(tmp_path):
+    manager = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path), live_slots=4,
+                                  retained_slots=2, max_frame_bytes=64)
+    for i in range(3):
+        manager.record_frame("cam", i, b"frame", [Detection("Oxygen Tank", 0.9, [0, 0, 1, 1])])
+    manager.close()
+
+    restarted = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path), live_slots=4,
+                                    retained_slots=2, max_frame_bytes=64)
+    stats = restarted.get_stats()["cameras"]["cam"]
+    assert stats["open"] is False
+    assert stats["live"]["frames_written"] == 3
+    assert "cam" not in restarted.cameras
+
+    result = restarted.replay("cam", lambda payload: [], source="live", last_n=2)
+    assert result["frames_replayed"] == 2
+    restarted.close()
+
+
+@pytest.mark.parametrize("camera_id", ["../escape", "a/b", "", "x" * 65, "cam\n"])
+def test_invalid_camera_id_rejected(tmp_path, camera_id):
+    manager = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path / "captures"))
+    with pytest.raises(ValueError):
+        manager.record_frame(camera_id, 1, b"frame", [])
+    assert not list(tmp_path.rglob("*.ring"))
+
+
+def test_camera_limit(tmp_path):
+    manager = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path), live_slots=2,
+                                  retained_slots=2, max_frame_bytes=64, max_cameras=1)
+    manager.record_frame("cam1", 1, b"frame", [])
+    assert manager.record_frame("cam2", 1, b"frame", []) == 0
+    assert "cam2" not in manager.cameras
+    assert manager.get_stats()["frames_skipped"] == 1
+
+    # Removing a camera frees its slot and its files
+    assert manager.remove_camera("cam1")
+    assert not list(tmp_path.glob("cam1.*"))
+    manager.record_frame("cam2", 1, b"frame", [])
+    assert "cam2" in manager.cameras
+    manager.close()
+
+
+@pytest.mark.parametrize("last_n", [0, -1, "5", 2.5, True])
+def test_replay_rejects_bad_last_n(tmp_path, last_n):
+    manager = FrameCaptureManager(CLASS_NAMES, capture_dir=str(tmp_path), live_slots=2,
+                                  retained_slots=2, max_frame_bytes=64)
+    manager.record_frame("cam", 1, b"frame", [])
+    with pytest.raises(ValueError):
+        manager.replay("cam", lambda payload: [], source="live", last_n=last_n)
+    manager.close()